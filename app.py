@@ -3,6 +3,8 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 from register_routes import register_all_blueprints
+from db_config import init_db
+from bot_filter import parse_ip_ranges
 
 load_dotenv()
 
@@ -15,6 +17,16 @@ app.config['MYSQL_HOST'] = os.environ.get('MYSQL_HOST')
 app.config['MYSQL_USER'] = os.environ.get('MYSQL_USER')
 app.config['MYSQL_PASSWORD'] = os.environ.get('MYSQL_PASSWORD')
 app.config['MYSQL_DB'] = os.environ.get('MYSQL_DB')
+app.config['BOT_IP_RANGES'] = parse_ip_ranges(os.environ.get('BOT_IP_RANGES', ''))
+
+# Database timeouts (seconds) and circuit breaker settings
+app.config['MYSQL_CONNECT_TIMEOUT'] = int(os.environ.get('MYSQL_CONNECT_TIMEOUT', 5))
+app.config['MYSQL_READ_TIMEOUT'] = int(os.environ.get('MYSQL_READ_TIMEOUT', 10))
+app.config['MYSQL_WRITE_TIMEOUT'] = int(os.environ.get('MYSQL_WRITE_TIMEOUT', 10))
+app.config['DB_FAILURE_THRESHOLD'] = int(os.environ.get('DB_FAILURE_THRESHOLD', 5))
+app.config['DB_RESET_TIMEOUT'] = int(os.environ.get('DB_RESET_TIMEOUT', 30))
+app.config['TRACKING_SPOOL_PATH'] = os.environ.get('TRACKING_SPOOL_PATH', 'spool/tracking.jsonl')
+init_db(app)
 
 # Register all blueprints
 register_all_blueprints(app)
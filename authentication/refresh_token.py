@@ -0,0 +1,100 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# Refresh token lifetime
+REFRESH_TOKEN_DAYS = 30
+
+# Hashes of refresh tokens revoked (or rotated) by this process, mapped to the
+# time after which the token would have expired anyway. Checked before touching
+# the database so replayed tokens fail fast. Every entry gets the same lifetime,
+# so insertion order is expiry order and pruning only looks at the front.
+# This is only a fast path: the database 'revoked' flag stays authoritative,
+# so evicting the oldest entries once the cap is hit is safe.
+MAX_REVOKED_HASHES = 10000
+_revoked_hashes = OrderedDict()
+_lock = threading.Lock()
+
+
+def hash_refresh_token(token):
+    """
+    Hash a refresh token with SHA-256.
+
+    Refresh tokens are long random strings, so a fast hash is enough;
+    only the hash is ever stored in the database.
+    """
+    if not token:
+        raise ValueError("Refresh token cannot be empty")
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def generate_refresh_token():
+    """
+    Create a new random refresh token and return (token, token_hash).
+    """
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def store_refresh_token(cursor, user_id, token_hash, expires_at=None):
+    """
+    Insert a refresh token hash for the user. The caller commits.
+
+    'expires_at' (naive UTC) defaults to REFRESH_TOKEN_DAYS from now. Rotation
+    passes the expiry of the token being replaced, so a session can't be
+    extended forever by refreshing.
+    """
+    if expires_at is None:
+        expires_at = (datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_DAYS)).replace(tzinfo=None)
+    cursor.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES (%s, %s, %s)",
+        (user_id, token_hash, expires_at)
+    )
+
+
+def revoke_user_refresh_tokens(cursor, user_id):
+    """
+    Revoke every refresh token of a user, e.g. when token reuse suggests theft.
+    The caller commits.
+    """
+    cursor.execute("UPDATE refresh_tokens SET revoked = 1 WHERE user_id = %s", (user_id,))
+
+
+def purge_expired_refresh_tokens(cursor, batch_size=1000):
+    """
+    Delete a batch of expired refresh token rows. The caller commits.
+    """
+    cursor.execute(
+        "DELETE FROM refresh_tokens WHERE expires_at < UTC_TIMESTAMP() LIMIT %s",
+        (batch_size,)
+    )
+
+
+def _prune(now):
+    # Caller must hold _lock
+    while _revoked_hashes:
+        token_hash, expires_at = next(iter(_revoked_hashes.items()))
+        if expires_at > now:
+            break
+        del _revoked_hashes[token_hash]
+
+
+def is_revoked(token_hash):
+    now = time.time()
+    with _lock:
+        _prune(now)
+        return token_hash in _revoked_hashes
+
+
+def mark_revoked(token_hash):
+    now = time.time()
+    with _lock:
+        _prune(now)
+        # A token can't outlive its lifetime from now, so forget it after that
+        _revoked_hashes[token_hash] = now + REFRESH_TOKEN_DAYS * 86400
+        _revoked_hashes.move_to_end(token_hash)
+        while len(_revoked_hashes) > MAX_REVOKED_HASHES:
+            _revoked_hashes.popitem(last=False)
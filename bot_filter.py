@@ -0,0 +1,152 @@
+import ipaddress
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+# Traffic classes
+HUMAN = 'human'
+CRAWLER = 'crawler'
+MONITOR = 'monitor'
+TOOL = 'tool'
+
+# Rules are checked in order; the first match wins
+_UA_RULES = [
+    (MONITOR, re.compile(
+        r'uptimerobot|pingdom|statuscake|site24x7|betteruptime|freshping|'
+        r'newrelicpinger|datadog|healthcheck|uptime-kuma|monitor',
+        re.IGNORECASE
+    )),
+    # Bots identify as '<name>bot/<version>'; a bare word ending in 'bot'
+    # is not enough, since device names like 'CUBOT P30' end the same way.
+    # Crawlers without a version go in the explicit list of bare tokens.
+    # Keep KNOWN_USER_AGENTS below in sync when changing this rule.
+    (CRAWLER, re.compile(
+        r'\b[\w-]*bot/|'
+        r'\b(?:slackbot|telegrambot|whatsapp|adsbot-google|google-inspectiontool|'
+        r'applebot|googlebot|bingbot|storebot-google|feedfetcher-google|'
+        r'duckduckbot|yandexbot|baiduspider|petalbot)\b|'
+        r'crawl|spider|slurp|facebookexternalhit|embedly|'
+        r'mediapartners|bingpreview|headlesschrome|phantomjs|lighthouse',
+        re.IGNORECASE
+    )),
+    (TOOL, re.compile(
+        r'^(curl|wget|python-requests|python-urllib|aiohttp|httpx|go-http-client|'
+        r'java/|okhttp|axios|node-fetch|postmanruntime|insomnia|libwww-perl)',
+        re.IGNORECASE
+    )),
+]
+
+# Known User-Agent strings and their expected class. Run
+# 'python bot_filter.py' after changing the rules to check them.
+KNOWN_USER_AGENTS = (
+    ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36', HUMAN),
+    ('Mozilla/5.0 (Linux; Android 10; CUBOT P30 Build/QP1A) Chrome/90.0 Mobile Safari/537.36', HUMAN),
+    ('Unknown', HUMAN),
+    ('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)', CRAWLER),
+    ('AdsBot-Google (+http://www.google.com/adsbot.html)', CRAWLER),
+    ('Mozilla/5.0 (compatible; Google-InspectionTool/1.0)', CRAWLER),
+    ('Mozilla/5.0 (Macintosh) AppleWebKit/605.1.15 (KHTML, like Gecko) Applebot', CRAWLER),
+    ('Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)', CRAWLER),
+    ('Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)', CRAWLER),
+    ('Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)', CRAWLER),
+    ('Twitterbot/1.0', CRAWLER),
+    ('facebookexternalhit/1.1', CRAWLER),
+    ('Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)', MONITOR),
+    ('curl/8.4.0', TOOL),
+    ('python-requests/2.31.0', TOOL),
+)
+
+_counter_lock = threading.Lock()
+_counters = Counter()
+
+
+@lru_cache(maxsize=4096)
+def classify_user_agent(user_agent):
+    """
+    Classify a User-Agent string as human, crawler, monitor or tool.
+    Results are memoized since the same few agents repeat constantly.
+    """
+    # Requests without a User-Agent are counted as human; only positive
+    # matches are dropped, so real visitors are never lost to a missing header
+    if not user_agent or user_agent == 'Unknown':
+        return HUMAN
+
+    for bot_class, pattern in _UA_RULES:
+        if pattern.search(user_agent):
+            return bot_class
+    return HUMAN
+
+
+def parse_ip_ranges(ip_ranges):
+    """
+    Parse a comma-separated list of CIDR blocks (the BOT_IP_RANGES setting).
+    Meant to run once at startup; invalid entries are skipped with a warning.
+    """
+    networks = []
+    for cidr in (ip_ranges or '').split(','):
+        cidr = cidr.strip()
+        if not cidr:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(cidr, strict=False))
+        except ValueError as e:
+            print(f"Ignoring invalid BOT_IP_RANGES entry '{cidr}': {str(e)}")
+    return tuple(networks)
+
+
+@lru_cache(maxsize=4096)
+def _ip_in_ranges(ip_address, ip_ranges):
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+    return any(address in network for network in ip_ranges)
+
+
+def classify_request(user_agent, ip_address=None, ip_ranges=()):
+    """
+    Classify a tracking request before any database work.
+
+    'ip_ranges' is an optional tuple of networks from parse_ip_ranges()
+    whose traffic is treated as crawler traffic.
+    """
+    bot_class = classify_user_agent(user_agent)
+    if bot_class == HUMAN and ip_address and ip_ranges and _ip_in_ranges(ip_address, ip_ranges):
+        bot_class = CRAWLER
+    return bot_class
+
+
+def record(endpoint, bot_class):
+    """
+    Count a classified request for the given tracking endpoint.
+    """
+    with _counter_lock:
+        _counters[(endpoint, bot_class)] += 1
+
+
+def get_counters():
+    """
+    Return per-endpoint, per-class counts plus the classifier cache stats.
+    """
+    with _counter_lock:
+        snapshot = dict(_counters)
+
+    counts = {}
+    for (endpoint, bot_class), count in snapshot.items():
+        counts.setdefault(endpoint, {})[bot_class] = count
+
+    cache = classify_user_agent.cache_info()
+    return {
+        'counts': counts,
+        'filtered_total': sum(c for (_, cls), c in snapshot.items() if cls != HUMAN),
+        'classifier_cache': {'hits': cache.hits, 'misses': cache.misses, 'size': cache.currsize}
+    }
+
+
+if __name__ == "__main__":
+    mismatches = [(ua, expected, classify_user_agent(ua)) for ua, expected in KNOWN_USER_AGENTS
+                  if classify_user_agent(ua) != expected]
+    for ua, expected, actual in mismatches:
+        print(f"{ua!r}: expected {expected}, got {actual}")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import request, current_app
+
+# Resource names used for versioning
+REVIEWS = 'reviews'
+VISITOR_STATS = 'visitor_stats'
+
+
+def get_validators(resource, version, updated_at, db_now, *variant):
+    """
+    Return the (etag, last_modified) pair for a resource.
+
+    'version' is any tuple read from the database that changes whenever the
+    resource does, so every worker (and writes made outside the app) agree.
+    Extra 'variant' values (role, offset, limit, ...) distinguish different
+    representations of the same resource.
+
+    'updated_at' and 'db_now' are UNIX timestamps from the database. Timestamps
+    only have one-second resolution, so Last-Modified is left out while the
+    latest change is still in the current second; another change in that same
+    second would otherwise not move it.
+    """
+    key = repr((resource, tuple(version), variant)).encode('utf-8')
+    etag = f"{resource}-{hashlib.sha1(key).hexdigest()[:16]}"
+
+    last_modified = None
+    if updated_at is not None and db_now is not None and int(db_now) > int(updated_at):
+        last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc)
+
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Check the request's conditional headers against the given validators.
+
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def add_cache_headers(response, etag, last_modified):
+    """
+    Attach ETag and Last-Modified headers so clients can revalidate cheaply.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    """
+    Build an empty 304 Not Modified response carrying the current validators.
+    """
+    response = current_app.response_class(status=304)
+    return add_cache_headers(response, etag, last_modified)
@@ -1,19 +1,151 @@
+import threading
+import time
 import pymysql
-from flask import current_app
+from flask import current_app, g
 
 # Use PyMySQL
 pymysql.install_as_MySQLdb()
 
+
+class CircuitBreaker:
+    """
+    Stop calling the database after repeated failures.
+
+    After 'failure_threshold' consecutive failures the breaker opens and
+    callers fail fast. Once 'reset_timeout' seconds have passed a single
+    trial request is allowed; success closes the breaker again.
+
+    Success is only recorded once a request's database work has finished
+    (see init_db), not when the connection opens, so a brownout where
+    connects succeed but queries time out still opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # In HALF_OPEN, a trial that never reported back is retried after the same timeout
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let one trial request through; others keep failing fast
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+
+
+db_breaker = CircuitBreaker()
+
+
+# Client/server errors meaning the database is unreachable or too slow.
+# Lock contention (1205 lock wait timeout, 1213 deadlock) is deliberately absent.
+UNAVAILABLE_ERRNOS = {
+    1040,  # Too many connections
+    1053,  # Server shutdown in progress
+    1317,  # Query execution was interrupted
+    1927,  # Connection was killed
+    2002,  # Can't connect through socket
+    2003,  # Can't connect to server
+    2006,  # Server has gone away
+    2013,  # Lost connection during query (also read/write timeouts)
+    2055,  # Lost connection at reading/sending
+    3024,  # Maximum statement execution time exceeded
+    4031,  # Disconnected by the server because of inactivity
+}
+
+
+def init_db(app):
+    """
+    Configure the circuit breaker from the app config and record a success
+    at the end of every request whose database work did not fail.
+    """
+    db_breaker.failure_threshold = app.config.get('DB_FAILURE_THRESHOLD', 5)
+    db_breaker.reset_timeout = app.config.get('DB_RESET_TIMEOUT', 30)
+
+    @app.teardown_request
+    def _report_db_outcome(exc):
+        if g.pop('db_used', False) and not g.pop('db_failed', False) and exc is None:
+            db_breaker.record_success()
+
+
 def get_db_connection():
+    if not db_breaker.allow_request():
+        return None
+
     try:
         conn = pymysql.connect(
             host=current_app.config['MYSQL_HOST'],
             user=current_app.config['MYSQL_USER'],
             password=current_app.config['MYSQL_PASSWORD'],
             database=current_app.config['MYSQL_DB'],
+            connect_timeout=current_app.config.get('MYSQL_CONNECT_TIMEOUT', 5),
+            read_timeout=current_app.config.get('MYSQL_READ_TIMEOUT', 10),
+            write_timeout=current_app.config.get('MYSQL_WRITE_TIMEOUT', 10),
             cursorclass=pymysql.cursors.DictCursor
         )
+        g.db_used = True
         return conn
     except pymysql.MySQLError as e:
+        g.db_failed = True
+        db_breaker.record_failure()
         print(f"Database connection error: {str(e)}")
         return None
+
+
+def is_unavailable_error(error):
+    """
+    True if the error means the database is unavailable (lost connection,
+    timeout), as opposed to a bad query, constraint or lock contention.
+    """
+    if isinstance(error, pymysql.InterfaceError):
+        # Raised when using a connection that is already closed
+        return True
+    errno = error.args[0] if error.args else None
+    return isinstance(error, pymysql.OperationalError) and errno in UNAVAILABLE_ERRNOS
+
+
+def report_db_error(error):
+    """
+    Feed a query error to the circuit breaker.
+
+    Returns True if the error means the database is unavailable.
+    """
+    if is_unavailable_error(error):
+        g.db_failed = True
+        db_breaker.record_failure()
+        return True
+    return False
+
+
+def report_db_success():
+    """
+    Record successful database work done outside a request (e.g. a background job).
+    """
+    db_breaker.record_success()
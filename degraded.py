@@ -0,0 +1,200 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows: file locks are skipped, only one process is safe
+    fcntl = None
+
+# Last-known-good read results, served while the database is unavailable
+MAX_SNAPSHOTS = 256
+_snapshots = OrderedDict()
+_snapshot_lock = threading.Lock()
+
+# Append-only spool for tracking writes made while the database is unavailable.
+# Writers append to the spool file; a replayer claims it with an atomic rename,
+# so appends from any process land either in the claimed file or a new spool.
+SPOOL_CHECK_INTERVAL = 5  # Seconds between disk checks for other processes' spools
+_spool_lock = threading.Lock()
+_spool_pending = False
+_next_spool_check = 0.0
+
+
+def save_snapshot(key, value):
+    """
+    Remember the latest successful result for a read.
+    """
+    with _snapshot_lock:
+        _snapshots[key] = value
+        _snapshots.move_to_end(key)
+        if len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+
+
+def snapshot_response(key):
+    """
+    Build a 200 response from the last-known-good result, or return None.
+    The response is marked with 'X-Data-Stale' so clients can tell.
+    """
+    with _snapshot_lock:
+        if key not in _snapshots:
+            return None
+        value = _snapshots[key]
+
+    response = jsonify(value)
+    response.headers['X-Data-Stale'] = 'true'
+    return response
+
+
+def _spool_path():
+    return current_app.config.get('TRACKING_SPOOL_PATH', 'spool/tracking.jsonl')
+
+
+def _lock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+
+
+def _append_lines(path, lines):
+    """
+    Append lines to 'path', retrying if the file was claimed (renamed)
+    while we waited for the lock.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    while True:
+        with open(path, 'a', encoding='utf-8') as spool:
+            _lock_file(spool)
+            try:
+                current = os.stat(path).st_ino == os.fstat(spool.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                continue
+            spool.write(''.join(lines))
+            spool.flush()
+            os.fsync(spool.fileno())
+            return
+
+
+def spool_events(events):
+    """
+    Append tracking events to the spool for replay once the database is back.
+    """
+    global _spool_pending
+    if not events:
+        return
+    lines = [json.dumps(event, default=str) + '\n' for event in events]
+
+    with _spool_lock:
+        _append_lines(_spool_path(), lines)
+        _spool_pending = True
+
+
+def spool_event(event):
+    spool_events([event])
+
+
+def dead_letter_event(event, error):
+    """
+    Move an event that cannot be applied out of the spool, keeping it for inspection.
+    """
+    record = dict(event, error=str(error))
+    with _spool_lock:
+        _append_lines(_spool_path() + '.failed', [json.dumps(record, default=str) + '\n'])
+
+
+def _claim_files(path):
+    return glob.glob(glob.escape(path) + '.*.replay')
+
+
+def has_spooled_events():
+    """
+    Cheap check for pending events. Spools written by other processes are
+    only noticed every SPOOL_CHECK_INTERVAL seconds.
+    """
+    global _spool_pending, _next_spool_check
+    now = time.monotonic()
+    if not _spool_pending and now >= _next_spool_check:
+        _next_spool_check = now + SPOOL_CHECK_INTERVAL
+        path = _spool_path()
+        _spool_pending = os.path.exists(path) or bool(_claim_files(path))
+    return _spool_pending
+
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        return True  # Can't check safely, so never adopt another process's claim
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def claim_spooled_events():
+    """
+    Atomically take ownership of the spooled events.
+
+    Returns (claim_path, events), or None if nothing is pending. Claims left
+    behind by a process that died mid-replay are adopted as well. The caller
+    must pass the claim to release_claim() once the events are applied or
+    re-spooled.
+    """
+    global _spool_pending
+    path = _spool_path()
+    claim = f"{path}.{os.getpid()}.{time.time_ns()}.replay"
+
+    try:
+        os.replace(path, claim)
+    except FileNotFoundError:
+        claim = None
+        for orphan in _claim_files(path):
+            try:
+                pid = int(os.path.basename(orphan).split('.')[-3])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            adopted = f"{path}.{os.getpid()}.{time.time_ns()}.replay"
+            try:
+                os.replace(orphan, adopted)
+            except FileNotFoundError:
+                continue  # Another process adopted it first
+            claim = adopted
+            break
+
+    if claim is None:
+        with _spool_lock:
+            _spool_pending = False
+        return None
+
+    events = []
+    with open(claim, 'r', encoding='utf-8') as replay:
+        # Wait for a writer that locked the file before it was renamed
+        _lock_file(replay)
+        for line in replay:
+            line = line.strip()
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # Skip a partially written line
+                    continue
+    return claim, events
+
+
+def release_claim(claim):
+    """
+    Delete a claimed spool file once its events are applied or re-spooled.
+    """
+    try:
+        os.remove(claim)
+    except FileNotFoundError:
+        pass
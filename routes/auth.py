@@ -1,7 +1,11 @@
 from flask import request, jsonify, current_app
-from db_config import get_db_connection
+from db_config import get_db_connection, report_db_error
 from authentication.hash_password import hash_password, verify_password
 from authentication.token_generator import generate_token
+from authentication.refresh_token import (
+    generate_refresh_token, hash_refresh_token, store_refresh_token,
+    purge_expired_refresh_tokens, revoke_user_refresh_tokens, is_revoked, mark_revoked
+)
 from . import auth_bp
 import pymysql
 
@@ -11,10 +15,10 @@ def sign_in():
     Sign in a user using username and password.
 
     Accepts a JSON payload with 'username' and 'password', validates the credentials,
-    and returns a JWT token on success.
+    and returns a JWT token and a refresh token on success.
 
     Returns:
-        200 OK: Login successful, returns user ID, role, and JWT token.
+        200 OK: Login successful, returns user ID, role, JWT token and refresh token.
         400 Bad Request: Missing input data.
         401 Unauthorized: Invalid username or password.
         500 Internal Server Error: Database or internal error.
@@ -54,16 +58,26 @@ def sign_in():
         # Generate a token with expiration
         token = generate_token(user_id, role, current_app.config['SECRET_KEY'], expires_in_hours=2)
 
+        # Issue a refresh token so the client can renew without signing in again
+        refresh_token, refresh_hash = generate_refresh_token()
+        with conn.cursor() as cursor:
+            store_refresh_token(cursor, user_id, refresh_hash)
+            # Sign-ins are rare, so clean up expired refresh tokens here
+            purge_expired_refresh_tokens(cursor)
+        conn.commit()
+
         return jsonify({
             'message': "Logged in successfully",
             'user': {
                 'id': user_id,
                 'role': role
             },
-            'token': token
+            'token': token,
+            'refresh_token': refresh_token
         }), 200
 
     except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
         return jsonify({'message': f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -127,6 +141,7 @@ def sign_up():
         return jsonify({"message": "User already exists"}), 409  # Handle duplicate entry
 
     except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
         return jsonify({"message": f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -134,3 +149,176 @@ def sign_up():
 
     finally:
         conn.close()
+
+
+@auth_bp.route('/token/refresh', methods=["POST"])
+def refresh_access_token():
+    """
+    Exchange a refresh token for a new access token.
+
+    Accepts a JSON payload with 'refresh_token'. The refresh token is rotated:
+    the presented one is revoked and a new one is returned alongside the JWT.
+    The new token keeps the original expiry, so sessions can't be extended forever.
+    Presenting an already revoked token revokes all of the user's refresh tokens.
+
+    Returns:
+        200 OK: New JWT token and refresh token.
+        400 Bad Request: Missing refresh token.
+        401 Unauthorized: Invalid, expired or revoked refresh token.
+        500 Internal Server Error: Database or internal error.
+    """
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('refresh_token'):
+        return jsonify({'message': "Refresh token is required"}), 400
+
+    if not isinstance(data['refresh_token'], str):
+        return jsonify({'message': "Refresh token must be a string"}), 400
+
+    token_hash = hash_refresh_token(data['refresh_token'])
+
+    # Replayed tokens are rejected from memory, before any token lookup
+    if is_revoked(token_hash):
+        _revoke_token_family(token_hash)
+        return jsonify({'message': "Refresh token has been revoked", 'loginRequired': True}), 401
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'message': "Database connection error"}), 500
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT rt.user_id, rt.revoked, rt.expires_at, u.role
+                FROM refresh_tokens rt
+                JOIN users u ON u.id = rt.user_id
+                WHERE rt.token_hash = %s AND rt.expires_at > UTC_TIMESTAMP()
+            """, (token_hash,))
+            row = cursor.fetchone()
+
+            if not row:
+                return jsonify({'message': "Invalid or expired refresh token", 'loginRequired': True}), 401
+
+            if row['revoked']:
+                # Reuse of a rotated token (possibly seen first by another worker):
+                # the token family may be stolen, so revoke all of it
+                revoke_user_refresh_tokens(cursor, row['user_id'])
+                conn.commit()
+                mark_revoked(token_hash)
+                return jsonify({'message': "Refresh token has been revoked", 'loginRequired': True}), 401
+
+            # Revoke the presented token; rowcount guards against concurrent reuse
+            cursor.execute(
+                "UPDATE refresh_tokens SET revoked = 1 WHERE token_hash = %s AND revoked = 0",
+                (token_hash,)
+            )
+            if cursor.rowcount != 1:
+                # Another request rotated this token at the same moment: the
+                # strongest sign of a stolen token, so revoke the whole family
+                conn.rollback()
+                revoke_user_refresh_tokens(cursor, row['user_id'])
+                conn.commit()
+                mark_revoked(token_hash)
+                return jsonify({'message': "Refresh token has been revoked", 'loginRequired': True}), 401
+
+            new_refresh_token, new_refresh_hash = generate_refresh_token()
+            store_refresh_token(cursor, row['user_id'], new_refresh_hash, expires_at=row['expires_at'])
+        conn.commit()
+        mark_revoked(token_hash)
+
+        token = generate_token(row['user_id'], row['role'], current_app.config['SECRET_KEY'], expires_in_hours=2)
+
+        return jsonify({
+            'message': "Token refreshed successfully",
+            'token': token,
+            'refresh_token': new_refresh_token
+        }), 200
+
+    except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
+        return jsonify({'message': f"Database error: {str(db_err)}"}), 500
+
+    except Exception as e:
+        return jsonify({'message': f"Internal error: {str(e)}"}), 500
+
+    finally:
+        conn.close()
+
+
+def _revoke_token_family(token_hash):
+    """
+    Revoke every refresh token of the user a replayed token belongs to,
+    since the token family may be stolen. Best effort: errors are only logged.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE refresh_tokens SET revoked = 1
+                WHERE user_id = (SELECT user_id FROM (
+                    SELECT user_id FROM refresh_tokens WHERE token_hash = %s
+                ) AS rt)
+            """, (token_hash,))
+        conn.commit()
+
+    except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
+        print(f"Refresh token revocation error: {str(db_err)}")
+
+    finally:
+        conn.close()
+
+
+@auth_bp.route('/token/revoke', methods=["POST"])
+def revoke_refresh_token():
+    """
+    Revoke a refresh token (e.g. on sign out).
+
+    Accepts a JSON payload with 'refresh_token'.
+
+    Returns:
+        200 OK: Refresh token revoked (also returned for unknown tokens).
+        400 Bad Request: Missing refresh token.
+        500 Internal Server Error: Database or internal error.
+    """
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('refresh_token'):
+        return jsonify({'message': "Refresh token is required"}), 400
+
+    if not isinstance(data['refresh_token'], str):
+        return jsonify({'message': "Refresh token must be a string"}), 400
+
+    token_hash = hash_refresh_token(data['refresh_token'])
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'message': "Database connection error"}), 500
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE refresh_tokens SET revoked = 1 WHERE token_hash = %s AND revoked = 0",
+                (token_hash,)
+            )
+            revoked = cursor.rowcount == 1
+        conn.commit()
+
+        # Only real tokens go in the in-memory set, so random input can't grow it
+        if revoked:
+            mark_revoked(token_hash)
+
+        return jsonify({'message': "Refresh token revoked"}), 200
+
+    except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
+        return jsonify({'message': f"Database error: {str(db_err)}"}), 500
+
+    except Exception as e:
+        return jsonify({'message': f"Internal error: {str(e)}"}), 500
+
+    finally:
+        conn.close()
@@ -1,6 +1,11 @@
 from flask import request, jsonify, current_app
-from db_config import get_db_connection
+from db_config import get_db_connection, report_db_error
 from authentication.token_generator import token_required
+from data_version import (
+    REVIEWS, get_validators, is_not_modified,
+    add_cache_headers, not_modified_response
+)
+from degraded import save_snapshot, snapshot_response
 from . import reviews_bp
 import pymysql
 import jwt
@@ -66,6 +71,7 @@ def add_review():
         return jsonify({"message": "Duplicate entry detected"}), 409  # Handle duplicates if constraints exist
 
     except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
         return jsonify({"message": f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -83,6 +89,9 @@ def get_reviews():
     - Admins see all reviews.
     - Other users see only 'approved' reviews.
     - Uses JWT if provided in Authorization header.
+    - Sends ETag/Last-Modified; conditional requests are answered after a cheap
+      version query, without fetching the page.
+    - Serves the last-known-good page if the database is unavailable.
 
     Query Params:
         offset (int): Pagination offset (default: 0)
@@ -90,6 +99,7 @@ def get_reviews():
 
     Returns:
         200 OK: List of reviews.
+        304 Not Modified: Reviews unchanged since the client's copy.
         403 Forbidden: Token error.
         404 Not Found: No reviews.
         500 Internal Server Error: Database or internal error.
@@ -109,15 +119,44 @@ def get_reviews():
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Invalid token'}), 403
 
+    offset = request.args.get('offset', default=0, type=int)
+    limit = request.args.get('limit', default=5, type=int)
+
+    view = 'admin' if current_user_role == 'admin' else 'public'
+    snapshot_key = (REVIEWS, view, offset, limit)
+
     conn = get_db_connection()
     if conn is None:
+        stale = snapshot_response(snapshot_key)
+        if stale is not None:
+            return stale, 200
         return jsonify({'message': "Database connection error"}), 500
 
     try:
-        offset = request.args.get('offset', default=0, type=int)
-        limit = request.args.get('limit', default=5, type=int)
-
         with conn.cursor() as cursor:
+            # Cheap version check: changes on every insert and status update
+            cursor.execute("""
+                SELECT COUNT(*) AS total,
+                       SUM(CASE WHEN status = 'approved' THEN id ELSE 0 END) AS approved_ids,
+                       SUM(CASE WHEN status = 'rejected' THEN id ELSE 0 END) AS rejected_ids,
+                       UNIX_TIMESTAMP(MAX(updated_time)) AS updated_at,
+                       UNIX_TIMESTAMP() AS db_now
+                FROM user_reviews
+            """)
+            version = cursor.fetchone()
+
+            # Admins and guests see different rows, so the role is part of the ETag
+            etag, last_modified = get_validators(
+                REVIEWS,
+                (version['total'], version['approved_ids'], version['rejected_ids'], version['updated_at']),
+                version['updated_at'], version['db_now'],
+                view, offset, limit
+            )
+            if is_not_modified(etag, last_modified):
+                response = not_modified_response(etag, last_modified)
+                response.vary.add('Authorization')
+                return response
+
             if current_user_role == 'admin':
                 query = """
                     SELECT id, name, review, rating, timestamp, status
@@ -139,8 +178,18 @@ def get_reviews():
         if not rows:
             return jsonify({"message": "No reviews found"}), 404
 
+        save_snapshot(snapshot_key, rows)
+
         # Directly return rows if DictCursor is used
-        return jsonify(rows), 200
+        response = add_cache_headers(jsonify(rows), etag, last_modified)
+        response.vary.add('Authorization')
+        return response, 200
+    except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            stale = snapshot_response(snapshot_key)
+            if stale is not None:
+                return stale, 200
+        return jsonify({"message": f"Database error: {str(db_err)}"}), 500
     except Exception as e:
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
     finally:
@@ -207,6 +256,7 @@ def update_review_status(current_user_id, review_id, current_user_role):
         return jsonify({'message': f"Review status updated to {new_status}"}), 200
 
     except pymysql.MySQLError as db_err:
+        report_db_error(db_err)
         return jsonify({'message': f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
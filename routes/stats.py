@@ -1,5 +1,12 @@
 from flask import jsonify
-from db_config import get_db_connection
+from db_config import get_db_connection, report_db_error
+from authentication.token_generator import token_required
+from bot_filter import get_counters
+from degraded import save_snapshot, snapshot_response
+from data_version import (
+    VISITOR_STATS, get_validators, is_not_modified,
+    add_cache_headers, not_modified_response
+)
 from . import stats_bp
 import pymysql
 
@@ -8,21 +15,29 @@ def get_visitor_stats():
     """
     Retrieve the most recent visitor statistics.
 
+    Sends ETag/Last-Modified; conditional requests get a 304 without a body.
+    Serves the last-known-good stats if the database is unavailable.
+
     Returns:
         200 OK: Latest visitor stats.
+        304 Not Modified: Stats unchanged since the client's copy.
         404 Not Found: No stats found.
         500 Internal Server Error: Database or internal error.
     """
 
     conn = get_db_connection()
     if conn is None:
+        stale = snapshot_response('visitor_stats')
+        if stale is not None:
+            return stale, 200
         return jsonify({'message': "Database connection error"}), 500
 
     try:
         with conn.cursor(pymysql.cursors.DictCursor) as cursor:  # Ensure DictCursor is used
             cursor.execute("""
                 SELECT date, visitors_today, visitors_yesterday, 
-                       visitors_this_week, visitors_this_month, total_visitors
+                       visitors_this_week, visitors_this_month, total_visitors,
+                       UNIX_TIMESTAMP(updated_time) AS updated_at, UNIX_TIMESTAMP() AS db_now
                 FROM visitor_stats 
                 ORDER BY date DESC 
                 LIMIT 1
@@ -32,9 +47,23 @@ def get_visitor_stats():
         if not row:
             return jsonify({"message": "No visitor statistics available"}), 404
 
-        return jsonify(row), 200  # Directly return the dictionary
+        # The row itself is the version, so every worker agrees on the ETag
+        updated_at = row.pop('updated_at')
+        db_now = row.pop('db_now')
+        etag, last_modified = get_validators(VISITOR_STATS, row.values(), updated_at, db_now)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        save_snapshot('visitor_stats', row)
+
+        # Directly return the dictionary
+        return add_cache_headers(jsonify(row), etag, last_modified), 200
 
     except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            stale = snapshot_response('visitor_stats')
+            if stale is not None:
+                return stale, 200
         return jsonify({'message': f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -49,6 +78,8 @@ def get_online_users():
     """
     Get the number of currently online users.
 
+    Serves the last-known-good count if the database is unavailable.
+
     Returns:
         200 OK: Online user count.
         500 Internal Server Error: Database or internal error.
@@ -56,6 +87,9 @@ def get_online_users():
 
     conn = get_db_connection()
     if conn is None:
+        stale = snapshot_response('online_users')
+        if stale is not None:
+            return stale, 200
         return jsonify({"message": "Database connection error"}), 500
 
     try:
@@ -72,9 +106,15 @@ def get_online_users():
         if count is None:
             raise ValueError("Unexpected data format: 'total' key is missing from result.")
 
+        save_snapshot('online_users', {"online_users": count})
+
         return jsonify({"online_users": count}), 200
 
     except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            stale = snapshot_response('online_users')
+            if stale is not None:
+                return stale, 200
         return jsonify({"message": f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -82,3 +122,26 @@ def get_online_users():
 
     finally:
         conn.close()
+
+
+@stats_bp.route("/bot-stats", methods=["GET"])
+@token_required
+def get_bot_stats(current_user_id, current_user_role):
+    """
+    Get per-class counts of tracking requests since startup (admin only).
+
+    Non-human requests were dropped before touching the database,
+    so 'filtered_total' is the write load avoided.
+
+    Returns:
+        200 OK: Counters per endpoint and traffic class.
+        403 Forbidden: User is not an admin.
+    """
+
+    if current_user_role != 'admin':
+        return jsonify({
+            'message': 'Admin access required',
+            'userMessage': 'You do not have permission to perform this action.'
+        }), 403
+
+    return jsonify(get_counters()), 200
@@ -1,9 +1,244 @@
-from flask import request, jsonify
-from db_config import get_db_connection
+from flask import request, jsonify, current_app
+from db_config import get_db_connection, report_db_error, report_db_success, is_unavailable_error
+from bot_filter import HUMAN, classify_request, record
+from degraded import (
+    spool_event, spool_events, has_spooled_events, claim_spooled_events,
+    release_claim, dead_letter_event
+)
 from . import visitor_bp
 import pymysql
+import threading
+import time
 from datetime import datetime
 
+# Upper bound on events accepted by /track/batch in one request
+MAX_BATCH_EVENTS = 100
+
+# Spooled events applied per transaction by the background replay job
+REPLAY_CHUNK_SIZE = 100
+_replay_thread = None
+_replay_thread_lock = threading.Lock()
+
+
+def _parse_visit(data):
+    """
+    Validate a visit payload. Returns (user_agent, visit_date, error_message).
+    """
+    user_agent = data.get("user_agent") or ""
+    visit_date = data.get("visit_date") or ""
+
+    if not isinstance(user_agent, str) or not isinstance(visit_date, str):
+        return None, None, "Invalid input: user_agent and visit_date must be strings"
+
+    user_agent = user_agent.strip()
+    if not user_agent:
+        user_agent = request.headers.get("User-Agent", "Unknown")
+
+    # Validate visit_date format
+    try:
+        visit_date = datetime.strptime(visit_date.strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return user_agent, None, "Invalid date format, expected YYYY-MM-DD"
+
+    return user_agent, visit_date, None
+
+
+def _parse_session_id(data):
+    """
+    Validate a heartbeat payload. Returns (session_id, error_message).
+    """
+    if not data or "session_id" not in data:
+        return None, "Missing session_id"
+
+    session_id = data.get("session_id")
+    if not isinstance(session_id, str) or not session_id.strip():
+        return None, "Invalid session_id"
+
+    return session_id.strip(), None
+
+
+def _update_visitor_stats(cursor, visit_date, new_visitors):
+    """
+    Add 'new_visitors' to the visitor_stats row for 'visit_date' and refresh
+    the rolling totals. Expects a DictCursor inside an open transaction.
+    """
+    cursor.execute("SELECT visitors_today FROM visitor_stats WHERE date = DATE_SUB(%s, INTERVAL 1 DAY) LIMIT 1", (visit_date,))
+    previous_day_result = cursor.fetchone()
+    visitors_yesterday = previous_day_result["visitors_today"] if previous_day_result else 0
+
+    cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS visitors_this_week FROM visitor_stats WHERE date BETWEEN DATE_SUB(%s, INTERVAL 6 DAY) AND %s", (visit_date, visit_date))
+    visitors_this_week = cursor.fetchone()["visitors_this_week"]
+
+    cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS visitors_this_month FROM visitor_stats WHERE date BETWEEN DATE_SUB(%s, INTERVAL 29 DAY) AND %s", (visit_date, visit_date))
+    visitors_this_month = cursor.fetchone()["visitors_this_month"]
+
+    cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS total_visitors FROM visitor_stats")
+    total_visitors = cursor.fetchone()["total_visitors"]
+
+    query_stats = """
+        INSERT INTO visitor_stats (date, visitors_today, visitors_yesterday, visitors_this_week, visitors_this_month, total_visitors)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE 
+            visitors_today = visitors_today + %s,
+            visitors_yesterday = VALUES(visitors_yesterday),
+            visitors_this_week = VALUES(visitors_this_week),
+            visitors_this_month = VALUES(visitors_this_month),
+            total_visitors = total_visitors + %s;
+    """
+    cursor.execute(query_stats, (visit_date, new_visitors, visitors_yesterday, visitors_this_week,
+                                 visitors_this_month, total_visitors, new_visitors, new_visitors))
+
+
+def _visit_event(ip_address, user_agent, visit_date):
+    return {"type": "visit", "ip_address": ip_address, "user_agent": user_agent,
+            "visit_date": visit_date.isoformat(), "ts": time.time()}
+
+
+def _heartbeat_event(ip_address, session_id):
+    return {"type": "heartbeat", "ip_address": ip_address, "session_id": session_id, "ts": time.time()}
+
+
+def _apply_spooled_event(cursor, event):
+    if event["type"] == "visit":
+        row = (event["ip_address"], event["user_agent"], event["visit_date"])
+        if _insert_visitor_logs(cursor, [row]):
+            _update_visitor_stats(cursor, event["visit_date"], 1)
+
+    elif event["type"] == "heartbeat":
+        # Heartbeats older than the 10 minute online window are no longer useful
+        if time.time() - event["ts"] < 600:
+            cursor.execute("""
+                INSERT INTO online_users (session_id, ip_address, last_active)
+                VALUES (%s, %s, FROM_UNIXTIME(%s))
+                ON DUPLICATE KEY UPDATE last_active = GREATEST(last_active, VALUES(last_active))
+            """, (event["session_id"], event["ip_address"], event["ts"]))
+
+    else:
+        raise ValueError(f"Unknown spooled event type: {event['type']}")
+
+
+def _apply_spooled_chunk(conn, events):
+    """
+    Apply a chunk of spooled events in one transaction.
+
+    An event that fails for any reason other than the database being
+    unavailable is rolled back on its own and moved to the dead-letter file,
+    so it can't block the rest of the spool forever.
+    """
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        for event in events:
+            cursor.execute("SAVEPOINT spooled_event")
+            try:
+                _apply_spooled_event(cursor, event)
+            except pymysql.MySQLError as db_err:
+                # Outages and lock conflicts are retried later with the whole chunk
+                if is_unavailable_error(db_err) or db_err.args[:1] in ((1205,), (1213,)):
+                    raise
+                cursor.execute("ROLLBACK TO SAVEPOINT spooled_event")
+                dead_letter_event(event, db_err)
+            except (KeyError, TypeError, ValueError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT spooled_event")
+                dead_letter_event(event, e)
+    conn.commit()
+
+
+def _replay_spooled_events(app):
+    """
+    Background job: apply tracking events spooled while the database was
+    unavailable, REPLAY_CHUNK_SIZE events per transaction. Stops and
+    re-spools the rest as soon as a chunk fails.
+    """
+    with app.app_context():
+        while True:
+            claimed = claim_spooled_events()
+            if claimed is None:
+                return
+            claim, events = claimed
+
+            try:
+                for start in range(0, len(events), REPLAY_CHUNK_SIZE):
+                    conn = get_db_connection()
+                    if conn is None:
+                        spool_events(events[start:])
+                        release_claim(claim)
+                        return
+
+                    try:
+                        _apply_spooled_chunk(conn, events[start:start + REPLAY_CHUNK_SIZE])
+                        report_db_success()
+                    except pymysql.MySQLError as db_err:
+                        # The uncommitted chunk is discarded when the connection closes
+                        report_db_error(db_err)
+                        print(f"Spool replay error: {str(db_err)}")
+                        spool_events(events[start:])
+                        release_claim(claim)
+                        return
+                    finally:
+                        if conn.open:
+                            conn.close()
+
+            except Exception as e:
+                # Keep the claim file; the next replay run adopts it
+                print(f"Spool replay error: {str(e)}")
+                return
+
+            release_claim(claim)
+
+
+def _schedule_replay():
+    """
+    Start the replay job if events are spooled and it isn't already running.
+    Called after a tracking request commits, i.e. once the database is back.
+    """
+    global _replay_thread
+    if not has_spooled_events():
+        return
+
+    with _replay_thread_lock:
+        if _replay_thread is not None and _replay_thread.is_alive():
+            return
+        _replay_thread = threading.Thread(
+            target=_replay_spooled_events,
+            args=(current_app._get_current_object(),),
+            daemon=True
+        )
+        _replay_thread.start()
+
+
+def _insert_visitor_logs(cursor, rows):
+    """
+    Insert (ip_address, user_agent, visit_date) rows into visitor_logs and
+    return the (user_agent, visit_date) keys that were actually new.
+
+    Tries one multi-row INSERT first. If some rows hit the unique key (a
+    concurrent request, or user agents equal under the column's collation or
+    prefix), it is rolled back and the rows are inserted one by one so each
+    gets an accurate status. Only duplicates are skipped; other data errors
+    still raise.
+    """
+    query = """
+        INSERT INTO visitor_logs (ip_address, user_agent, visit_date)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = id
+    """
+
+    cursor.execute("SAVEPOINT visitor_logs_batch")
+    # executemany turns this into one multi-row INSERT; duplicates count as 0 rows
+    cursor.executemany(query, rows)
+    if cursor.rowcount == len(rows):
+        cursor.execute("RELEASE SAVEPOINT visitor_logs_batch")
+        return [(user_agent, visit_date) for _, user_agent, visit_date in rows]
+
+    cursor.execute("ROLLBACK TO SAVEPOINT visitor_logs_batch")
+    inserted = []
+    for row in rows:
+        cursor.execute(query, row)
+        if cursor.rowcount == 1:
+            inserted.append((row[1], row[2]))
+    cursor.execute("RELEASE SAVEPOINT visitor_logs_batch")
+    return inserted
+
+
 @visitor_bp.route("/track-visitor", methods=["POST"])
 def track_visitor():
     """
@@ -11,9 +246,12 @@ def track_visitor():
 
     Accepts a JSON payload with 'visit_date' and optional 'user_agent'.
     Logs the visitor and updates visitor stats if the visitor is new for the day.
+    Crawlers, monitors and scripted clients are counted and skipped before any DB work.
+    If the database is unavailable the visit is spooled and replayed later.
 
     Returns:
-        200 OK: Visitor tracked and stats updated.
+        200 OK: Visitor tracked and stats updated, or bot traffic ignored.
+        202 Accepted: Database unavailable, visit queued for replay.
         400 Bad Request: Invalid input or date format.
         500 Internal Server Error: Database or internal error.
     """
@@ -23,41 +261,26 @@ def track_visitor():
     if not data:
         return jsonify({"message": "Invalid input"}), 400
 
-    user_agent = data.get("user_agent", "").strip()
-    visit_date = data.get("visit_date", "").strip()
     ip_address = request.remote_addr
+    user_agent, visit_date, error = _parse_visit(data)
 
-    if not user_agent:
-        user_agent = request.headers.get("User-Agent", "Unknown")
+    if error:
+        return jsonify({"message": error}), 400
 
-    # Validate visit_date format
-    try:
-        visit_date = datetime.strptime(visit_date, "%Y-%m-%d").date()
-    except ValueError:
-        return jsonify({"message": "Invalid date format, expected YYYY-MM-DD"}), 400
+    bot_class = classify_request(user_agent, ip_address, current_app.config.get('BOT_IP_RANGES', ()))
+    record('track_visitor', bot_class)
+    if bot_class != HUMAN:
+        return jsonify({"message": "Bot traffic ignored", "class": bot_class}), 200
 
     conn = get_db_connection()
     if conn is None:
-        return jsonify({"message": "Database connection error"}), 500
+        spool_event(_visit_event(ip_address, user_agent, visit_date))
+        return jsonify({"message": "Visitor queued for tracking"}), 202
 
     try:
         with conn.cursor(pymysql.cursors.DictCursor) as cursor:  # Use DictCursor to return dictionary results
 
-            # Step 1: Fetch Previous Data Before Insert
-            cursor.execute("SELECT visitors_today FROM visitor_stats WHERE date = DATE_SUB(%s, INTERVAL 1 DAY) LIMIT 1", (visit_date,))
-            previous_day_result = cursor.fetchone()
-            visitors_yesterday = previous_day_result["visitors_today"] if previous_day_result else 0
-
-            cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS visitors_this_week FROM visitor_stats WHERE date BETWEEN DATE_SUB(%s, INTERVAL 6 DAY) AND %s", (visit_date, visit_date))
-            visitors_this_week = cursor.fetchone()["visitors_this_week"]
-
-            cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS visitors_this_month FROM visitor_stats WHERE date BETWEEN DATE_SUB(%s, INTERVAL 29 DAY) AND %s", (visit_date, visit_date))
-            visitors_this_month = cursor.fetchone()["visitors_this_month"]
-
-            cursor.execute("SELECT COALESCE(SUM(visitors_today), 0) AS total_visitors FROM visitor_stats")
-            total_visitors = cursor.fetchone()["total_visitors"]
-
-            # Step 2: Attempt to insert visitor into visitor_logs
+            # Step 1: Attempt to insert visitor into visitor_logs
             try:
                 query_logs = """
                     INSERT INTO visitor_logs (ip_address, user_agent, visit_date)
@@ -70,24 +293,19 @@ def track_visitor():
                 # Visitor already exists (same IP + User Agent + Date), do not count again
                 is_new_visitor = False
 
-            # Step 3: If this is a new visitor, update visitor_stats
+            # Step 2: If this is a new visitor, update visitor_stats
             if is_new_visitor:
-                query_stats = """
-                    INSERT INTO visitor_stats (date, visitors_today, visitors_yesterday, visitors_this_week, visitors_this_month, total_visitors)
-                    VALUES (%s, 1, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE 
-                        visitors_today = visitors_today + 1,
-                        visitors_yesterday = VALUES(visitors_yesterday),
-                        visitors_this_week = VALUES(visitors_this_week),
-                        visitors_this_month = VALUES(visitors_this_month),
-                        total_visitors = total_visitors + 1;
-                """
-                cursor.execute(query_stats, (visit_date, visitors_yesterday, visitors_this_week, visitors_this_month, total_visitors))
+                _update_visitor_stats(cursor, visit_date, 1)
 
         conn.commit()
+        _schedule_replay()
+
         return jsonify({"message": "Visitor logged and stats updated successfully"}), 200
 
     except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            spool_event(_visit_event(ip_address, user_agent, visit_date))
+            return jsonify({"message": "Visitor queued for tracking"}), 202
         return jsonify({"message": f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
@@ -104,27 +322,34 @@ def track_online():
 
     Accepts a JSON payload with 'session_id'. Updates the last active time,
     and cleans up sessions inactive for more than 10 minutes.
+    Bot traffic is counted and skipped before any DB work.
+    If the database is unavailable the heartbeat is spooled and replayed later.
 
     Returns:
-        200 OK: User tracked.
+        200 OK: User tracked, or bot traffic ignored.
+        202 Accepted: Database unavailable, heartbeat queued for replay.
         400 Bad Request: Invalid or missing session_id.
         500 Internal Server Error: Database or internal error.
     """
 
     data = request.get_json()
 
-    if not data or "session_id" not in data:
-        return jsonify({"message": "Missing session_id"}), 400
-
-    session_id = data.get("session_id", "").strip()
+    session_id, error = _parse_session_id(data)
     ip_address = request.remote_addr
 
-    if not session_id:
-        return jsonify({"message": "Invalid session_id"}), 400
+    if error:
+        return jsonify({"message": error}), 400
+
+    user_agent = request.headers.get("User-Agent", "Unknown")
+    bot_class = classify_request(user_agent, ip_address, current_app.config.get('BOT_IP_RANGES', ()))
+    record('track_online', bot_class)
+    if bot_class != HUMAN:
+        return jsonify({"message": "Bot traffic ignored", "class": bot_class}), 200
 
     conn = get_db_connection()
     if conn is None:
-        return jsonify({"message": "Database connection error"}), 500
+        spool_event(_heartbeat_event(ip_address, session_id))
+        return jsonify({"message": "Online user queued for tracking"}), 202
 
     try:
         with conn.cursor() as cursor:
@@ -139,13 +364,164 @@ def track_online():
             cursor.execute("DELETE FROM online_users WHERE last_active < NOW() - INTERVAL 10 MINUTE")
 
         conn.commit()
+        _schedule_replay()
         return jsonify({"message": "Online user tracked successfully"}), 200
 
     except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            spool_event(_heartbeat_event(ip_address, session_id))
+            return jsonify({"message": "Online user queued for tracking"}), 202
+        return jsonify({"message": f"Database error: {str(db_err)}"}), 500
+
+    except Exception as e:
+        return jsonify({"message": f"Internal error: {str(e)}"}), 500
+
+    finally:
+        conn.close()
+
+
+@visitor_bp.route("/track/batch", methods=["POST"])
+def track_batch():
+    """
+    Track several visits and heartbeats in a single request.
+
+    Accepts a JSON payload with an 'events' array. Each event has a 'type' of
+    'visit' (same fields as /track-visitor) or 'heartbeat' (same fields as
+    /track-online). Events are validated individually and all valid ones are
+    applied in one transaction. The body may be sent as text/plain so that
+    navigator.sendBeacon can be used. If the database is unavailable the
+    valid events are spooled and replayed later.
+
+    Returns:
+        200 OK: Per-event results, in request order.
+        202 Accepted: Database unavailable, valid events queued for replay.
+        400 Bad Request: Missing, empty or oversized 'events' array.
+        500 Internal Server Error: Database or internal error.
+    """
+
+    data = request.get_json(force=True, silent=True)
+    events = data.get("events") if isinstance(data, dict) else None
+
+    if not isinstance(events, list) or not events:
+        return jsonify({"message": "Expected a non-empty 'events' array"}), 400
+
+    if len(events) > MAX_BATCH_EVENTS:
+        return jsonify({"message": f"Too many events, maximum is {MAX_BATCH_EVENTS}"}), 400
+
+    ip_address = request.remote_addr
+    bot_ip_ranges = current_app.config.get('BOT_IP_RANGES', ())
+    results = [None] * len(events)
+    visits = {}      # (user_agent, visit_date) -> indexes of matching events
+    sessions = {}    # session_id -> indexes of matching events
+
+    for index, event in enumerate(events):
+        event_type = event.get("type") if isinstance(event, dict) else None
+
+        if event_type == "visit":
+            user_agent, visit_date, error = _parse_visit(event)
+            endpoint = 'track_visitor'
+        elif event_type == "heartbeat":
+            session_id, error = _parse_session_id(event)
+            user_agent = request.headers.get("User-Agent", "Unknown")
+            endpoint = 'track_online'
+        else:
+            results[index] = {"index": index, "status": "invalid", "message": "Unknown event type"}
+            continue
+
+        if error:
+            results[index] = {"index": index, "type": event_type, "status": "invalid", "message": error}
+            continue
+
+        bot_class = classify_request(user_agent, ip_address, bot_ip_ranges)
+        record(endpoint, bot_class)
+        if bot_class != HUMAN:
+            results[index] = {"index": index, "type": event_type, "status": "ignored", "class": bot_class}
+        elif event_type == "visit":
+            visits.setdefault((user_agent, visit_date), []).append(index)
+        else:
+            sessions.setdefault(session_id, []).append(index)
+
+    if not visits and not sessions:
+        return jsonify({"message": "No events to track", "results": results}), 200
+
+    conn = get_db_connection()
+    if conn is None:
+        return _spool_batch(ip_address, visits, sessions, results)
+
+    try:
+        new_visits = set()
+
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            if visits:
+                # Find which (user_agent, date) pairs are already logged for this IP
+                dates = sorted({visit_date for _, visit_date in visits})
+                placeholders = ", ".join(["%s"] * len(dates))
+                cursor.execute(
+                    f"SELECT user_agent, visit_date FROM visitor_logs WHERE ip_address = %s AND visit_date IN ({placeholders})",
+                    (ip_address, *dates)
+                )
+                logged = {(row["user_agent"], row["visit_date"]) for row in cursor.fetchall()}
+
+                for visit_date in dates:
+                    rows = [(ip_address, user_agent, day) for (user_agent, day) in visits
+                            if day == visit_date and (user_agent, day) not in logged]
+                    if not rows:
+                        continue
+
+                    inserted = _insert_visitor_logs(cursor, rows)
+                    if inserted:
+                        _update_visitor_stats(cursor, visit_date, len(inserted))
+                        new_visits.update(inserted)
+
+            if sessions:
+                cursor.executemany("""
+                    INSERT INTO online_users (session_id, ip_address)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE last_active = CURRENT_TIMESTAMP
+                """, [(session_id, ip_address) for session_id in sessions])
+
+                # Clean up inactive sessions older than 10 minutes
+                cursor.execute("DELETE FROM online_users WHERE last_active < NOW() - INTERVAL 10 MINUTE")
+
+        conn.commit()
+        _schedule_replay()
+
+        for key, indexes in visits.items():
+            for position, index in enumerate(indexes):
+                # Only the first event for a visitor can count as new
+                status = "tracked" if key in new_visits and position == 0 else "duplicate"
+                results[index] = {"index": index, "type": "visit", "status": status}
+
+        for indexes in sessions.values():
+            for index in indexes:
+                results[index] = {"index": index, "type": "heartbeat", "status": "tracked"}
+
+        return jsonify({"message": "Events tracked successfully", "results": results}), 200
+
+    except pymysql.MySQLError as db_err:
+        if report_db_error(db_err):
+            return _spool_batch(ip_address, visits, sessions, results)
         return jsonify({"message": f"Database error: {str(db_err)}"}), 500
 
     except Exception as e:
         return jsonify({"message": f"Internal error: {str(e)}"}), 500
 
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def _spool_batch(ip_address, visits, sessions, results):
+    """
+    Spool the valid events of a batch and mark them as queued.
+    """
+    for (user_agent, visit_date), indexes in visits.items():
+        spool_event(_visit_event(ip_address, user_agent, visit_date))
+        for index in indexes:
+            results[index] = {"index": index, "type": "visit", "status": "queued"}
+
+    for session_id, indexes in sessions.items():
+        spool_event(_heartbeat_event(ip_address, session_id))
+        for index in indexes:
+            results[index] = {"index": index, "type": "heartbeat", "status": "queued"}
+
+    return jsonify({"message": "Events queued for tracking", "results": results}), 202